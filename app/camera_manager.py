@@ -1,37 +1,99 @@
+import os
+import shutil
+import hashlib
+import asyncio
 import cv2
 import time
 import json
 import threading  # Keep this import
 import numpy as np
+import torch
+import yaml
+from pydantic import TypeAdapter
 from uuid import uuid4
 from typing import Dict, List, Tuple, Optional, Union
 from ultralytics import YOLO
-from queue import Queue, Empty # Import Queue
+from ultralytics.engine.results import Boxes
 
+from app.capture import is_live_source, open_capture, source_frame_interval
+from app.cuda_graph import GraphedDetector
+from app.detection import HALF_PRECISION, IMGSZ, MAX_BATCH, create_object_tracker, live_track_ids
+from app.engine import EngineDetector
+from app.jpeg import encode_jpeg
 from app.models import CameraConfig, TrackingStats, Point
+from app.preprocess import GpuPreprocessor, predict_downscaled, split_to_host
+from app.sprites import LabelSprites, StatsOverlay, draw_boxes
+from app import tracking_kernels
+
+# Camera frames sampled for INT8 calibration, at most one batch every INT8_CALIB_INTERVAL seconds
+INT8_CALIB_FRAMES = 300
+INT8_CALIB_INTERVAL = 1.0
+INT8_CALIB_DIR = 'calib'
+# Built TensorRT engines, named after everything that makes one engine incompatible with another
+ENGINE_CACHE_DIR = 'cache'
+# Disabled cameras don't count, so they only run detection this often (seconds) to refresh snapshots
+DISABLED_DETECT_INTERVAL = 1.0
+# Frames whose 80x45 grayscale thumbnail differs from the last detected frame's by less than this
+# mean absolute difference skip detection, for at most MOTION_MAX_SKIP seconds in a row
+MOTION_THRESHOLD = 2.5
+MOTION_MAX_SKIP = 0.5
+
+# Serializers for the cached list endpoint responses
+_CAMERA_LIST = TypeAdapter(List[CameraConfig])
+_STATS_LIST = TypeAdapter(List[TrackingStats])
+
 
 # --- CameraTracker Class ---
 class CameraTracker:
     """Handles tracking for a single camera"""
     
-    def __init__(self, camera_config: CameraConfig, model: YOLO):
+    def __init__(self, camera_config: CameraConfig, frame_cond: Optional[threading.Condition] = None):
         self.config = camera_config
-        self.model = model
+        # Detection runs batched in CameraManager; the tracker keeps this camera's IDs
+        self.tracker = create_object_tracker()
         self.is_running = False
-        self.processing_thread = None
         self.reader_thread = None # Thread for reading frames
-        self.frame_queue = Queue(maxsize=2) # Use a queue to hold frames
+        # Single-slot buffer holding only the newest decoded frame; the condition is shared
+        # with CameraManager so its inference loop can wait on all cameras at once
+        self.frame_cond = frame_cond or threading.Condition()
+        self._latest_frame: Optional[np.ndarray] = None
         self.lock = threading.Lock()
 
         # State
-        self.last_frame: Optional[np.ndarray] = None
-        self.annotated_frame: Optional[np.ndarray] = None
+        # (seq, newest frame, annotation) published by the inference thread with a single
+        # attribute store, so readers never lock. seq is bumped on every publish and keys the
+        # JPEG cache; the annotation is (boxes, ids or None, line, (in, out, in frame)) from the
+        # last detected frame, drawn over the newest frame only when an annotated one is requested
+        self._published: Tuple[int, Optional[np.ndarray], Optional[tuple]] = (0, None, None)
+        # Reusable buffer the overlays are drawn into; only touched under _jpeg_lock
+        self._annot_buf: Optional[np.ndarray] = None
+        self._last_detect_ts = 0.0
+        # Grayscale thumbnail of the last frame sent through detection, for motion gating
+        self._motion_ref: Optional[np.ndarray] = None
+        # annotated? -> (frame seq, JPEG bytes), so concurrent viewers share one encode per frame
+        self._jpeg_cache: Dict[bool, Tuple[int, bytes]] = {}
+        self._jpeg_lock = threading.Lock()
+        # Tells this tracker's frame seqs apart from those of the tracker it replaced, for ETags
+        self.stream_id = uuid4().hex[:8]
+        # (event loop, event) pairs set whenever a new frame is published; copy-on-write
+        self._frame_listeners: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        # Pre-rendered text for the annotated frames
+        self._stats_overlay = StatsOverlay((0, 0, 255))
+        self._label_sprites = LabelSprites("ID {}", (0, 255, 0))
         self.stats = TrackingStats(camera_id=self.config.camera_id, camera_name=self.config.name)
-        self.last_positions: Dict[str, Tuple[int, int]] = {}
-        self.counted_ids: set[str] = set()
+        # Wall-clock time of the last processed frame; formatted into stats.last_updated on read
+        self._last_updated_ts: Optional[float] = None
+        # Last center of every track ID the tracker still knows and whether it was counted "in",
+        # stored structure-of-arrays: one row per ID
+        self._pos_arr = np.zeros((256, 2), dtype=np.int32)
+        self._counted = np.zeros(256, dtype=bool)
+        self._id_to_row: Dict[int, int] = {}
+        self._free_rows: List[int] = list(range(len(self._pos_arr) - 1, -1, -1))
+        # (frame shape, id of line_points, (p1, p2, (a, b, c))) - see _counting_line
+        self._line_cache = (None, None, None)
 
     def start(self):
-        """Start the tracking and reading threads"""
+        """Start the frame reader thread"""
         # --- FIX: Remove the 'enabled' check, only check if already running ---
         if self.is_running:
             return
@@ -39,36 +101,42 @@ class CameraTracker:
         # Start the frame reader thread
         self.reader_thread = threading.Thread(target=self._frame_reader_loop, daemon=True)
         self.reader_thread.start()
-        # Start the main processing thread
-        self.processing_thread = threading.Thread(target=self._tracking_loop, daemon=True)
-        self.processing_thread.start()
             
     def stop(self):
-        """Stop the tracking threads"""
+        """Stop the frame reader thread"""
         self.is_running = False
         # Wait for threads to finish
         if self.reader_thread:
             self.reader_thread.join(timeout=2)
-        if self.processing_thread:
-            self.processing_thread.join(timeout=2)
 
     def _frame_reader_loop(self):
-        """Dedicated loop to read frames from the camera and put them in a queue."""
+        """Dedicated loop to read frames from the camera into the latest-frame slot."""
         cap = None
+        live = is_live_source(self.config.stream_url)
+        frame_interval = 0.0
+        next_read_ts = 0.0
         while self.is_running:
             try:
                 # --- START: ROBUST RECONNECTION LOGIC ---
                 if cap is None or not cap.isOpened():
                     print(f"Attempting to connect to camera: {self.config.name}")
-                    cap = cv2.VideoCapture(self.config.stream_url)
+                    cap = open_capture(self.config.stream_url)
                     if not cap.isOpened():
                         print(f"Error: Could not open stream for {self.config.name}. Retrying in 5 seconds...")
                         time.sleep(5)
                         continue # Go to the start of the loop and try again
+                    frame_interval = source_frame_interval(cap)
 
-                if self.frame_queue.full():
-                    time.sleep(0.01)
-                    continue
+                if not live:
+                    # A file isn't real time: decode the next frame only once the last one has been
+                    # taken, and no faster than the file's own frame rate, so detection sees every frame
+                    with self.frame_cond:
+                        while self.is_running and self._latest_frame is not None:
+                            self.frame_cond.wait(timeout=1.0)
+                    delay = next_read_ts - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_read_ts = time.monotonic() + frame_interval
 
                 grabbed = cap.grab()
                 if not grabbed:
@@ -78,10 +146,18 @@ class CameraTracker:
                     time.sleep(2)
                     continue
                 
+                # --- END: ROBUST RECONNECTION LOGIC ---
+
+                # The previous frame hasn't been consumed yet: drop this live frame without converting it.
+                # This keeps retrieve() at exactly the rate inference consumes frames, however slow it runs
+                if self._latest_frame is not None:
+                    continue
+
                 ret, frame = cap.retrieve()
                 if ret:
-                    self.frame_queue.put(frame)
-                # --- END: ROBUST RECONNECTION LOGIC ---
+                    with self.frame_cond:
+                        self._latest_frame = frame
+                        self.frame_cond.notify_all()
 
             except Exception as e:
                 print(f"Error in frame reader for {self.config.name}: {e}")
@@ -94,112 +170,209 @@ class CameraTracker:
             cap.release()
         print(f"Frame reader stopped for {self.config.name}")
 
-    def _tracking_loop(self):
-        """The main loop for video processing, now consuming from the queue."""
-        print(f"Tracking loop started for {self.config.name}")
-        while self.is_running:
-            try:
-                # Get a frame from the queue with a timeout
-                frame = self.frame_queue.get(timeout=1.0)
-            except Empty:
-                # If queue is empty, loop again to check self.is_running
-                continue
-            except Exception as e:
-                print(f"Error getting frame from queue for {self.config.name}: {e}")
-                continue
+    def take_frame(self) -> Optional[np.ndarray]:
+        """Take the newest decoded frame, emptying the slot so the reader decodes another."""
+        with self.frame_cond:
+            frame, self._latest_frame = self._latest_frame, None
+            if frame is not None:
+                # Wakes a file reader waiting for the slot to empty
+                self.frame_cond.notify_all()
+        return frame
 
-            try:
-                # --- The rest of the processing logic remains the same ---
-                frame_height, frame_width, _ = frame.shape
-                
-                # Process the frame for object detection regardless of enabled status
-                results = self.model.track(frame, persist=True, classes=[0], verbose=False)
+    def needs_detection(self, frame: np.ndarray) -> bool:
+        """Whether this frame should be sent through the model."""
+        since_detect = time.monotonic() - self._last_detect_ts
+        if not self.config.enabled:
+            return since_detect >= DISABLED_DETECT_INTERVAL
+
+        # Nothing moved since the last detected frame: its tracks and counts still hold
+        thumb = cv2.cvtColor(cv2.resize(frame, (80, 45), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if (self._motion_ref is not None and since_detect < MOTION_MAX_SKIP
+                and self._motion_ref.shape == thumb.shape
+                and cv2.absdiff(thumb, self._motion_ref).mean() < MOTION_THRESHOLD):
+            return False
+        self._motion_ref = thumb
+        return True
+
+    def store_frame(self, frame: np.ndarray):
+        """Publish a raw frame that skipped detection so snapshots stay current."""
+        seq, _, annotation = self._published
+        self._published = (seq + 1, frame, annotation)
+        self._notify_frame_listeners()
+
+    def process_result(self, frame: np.ndarray, detections: Boxes):
+        """Track, count and annotate one frame; called from CameraManager's inference loop."""
+        if not self.is_running:
+            return
+        try:
+            line = self._counting_line(frame.shape)
+            self._last_detect_ts = time.monotonic()
+            
+            if self.config.enabled:
+                # Associate this camera's detections with its own tracks
+                tracks = self.tracker.update(detections, frame)
+                self._free_ended_rows()
+            else:
+                # Periodic snapshot detections must not advance the tracker state; draw them without IDs
+                tracks = np.empty((0, 8))
+            
+            in_frame = 0
+            boxes, ids = np.empty((0, 4), dtype=int), None
+
+            if len(tracks) > 0:
+                boxes = tracks[:, :4].astype(int)
+                ids = tracks[:, 4].astype(int)
+                centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+                in_frame = len(ids)
+                rows = self._position_rows(ids, centers)
                 
-                annotated_frame = frame.copy()
-                current_ids = set()
-
-                # Draw detected people
-                if results[0].boxes.id is not None:
-                    boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-                    ids = results[0].boxes.id.cpu().numpy().astype(int)
-                    
-                    for box, obj_id in zip(boxes, ids):
-                        # Basic detection and drawing happens regardless of enabled status
-                        x1, y1, x2, y2 = box
-                        center = ((x1 + x2) // 2, (y1 + y2) // 2)
-                        str_id = str(obj_id)
-                        current_ids.add(str_id)
-                        
-                        # Only do counting logic if the camera is enabled
-                        if self.config.enabled and self.config.line_points and len(self.config.line_points) >= 2:
-                            p1 = (self.config.line_points[0].x * frame_width // 100, self.config.line_points[0].y * frame_height // 100)
-                            p2 = (self.config.line_points[1].x * frame_width // 100, self.config.line_points[1].y * frame_height // 100)
-                            
-                            prev_pos = self.last_positions.get(str_id)
-                            if prev_pos:
-                                side_before = self._get_side(p1, p2, prev_pos)
-                                side_after = self._get_side(p1, p2, center)
-                                
-                                if side_before is not None and side_after is not None and side_before != side_after:
-                                    if side_after == 1 and str_id not in self.counted_ids:
-                                        self.stats.people_in += 1
-                                        self.counted_ids.add(str_id)
-                                    elif side_after == -1 and str_id in self.counted_ids:
-                                        self.stats.people_out += 1
-                                        self.counted_ids.remove(str_id)
-                            
-                        self.last_positions[str_id] = center
-                        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(annotated_frame, f"ID {str_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                # Draw the counting line
-                if self.config.line_points and len(self.config.line_points) >= 2:
-                    p1 = (self.config.line_points[0].x * frame_width // 100, self.config.line_points[0].y * frame_height // 100)
-                    p2 = (self.config.line_points[1].x * frame_width // 100, self.config.line_points[1].y * frame_height // 100)
-                    cv2.line(annotated_frame, p1, p2, (255, 0, 0), 2)
-
-                # Always show stats
-                cv2.putText(annotated_frame, f"In: {self.stats.people_in}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                cv2.putText(annotated_frame, f"Out: {self.stats.people_out}", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                cv2.putText(annotated_frame, f"In Frame: {len(current_ids)}", (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-                # Always update the frames (needed for snapshots)
-                with self.lock:
-                    self.last_frame = frame
-                    self.annotated_frame = annotated_frame
-                    # Only update counting stats if enabled
-                    if self.config.enabled:
-                        self.stats.current_count = len(current_ids)
-                        self.stats.total_tracked = max(self.stats.total_tracked, len(self.last_positions))
-                    self.stats.last_updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-
-                # Only update tracking state if the camera is enabled
+                # Only do counting logic if the camera is enabled
+                if self.config.enabled and line:
+                    a, b, c = line[2]
+                    # New IDs were seeded with their current center so they can't cross
+                    people_in, people_out = tracking_kernels.count_crossings(
+                        self._pos_arr, self._counted, rows, centers, a, b, c)
+                    self.stats.people_in += people_in
+                    self.stats.people_out += people_out
+                else:
+                    self._pos_arr[rows] = centers
+
+            elif not self.config.enabled:
+                in_frame = len(detections)
+                boxes = detections.xyxy.astype(int)
+
+            # Always update the frames (needed for snapshots)
+            seq = self._published[0] + 1
+            counts = (self.stats.people_in, self.stats.people_out, in_frame)
+            self._published = (seq, frame, (boxes, ids, line, counts))
+            with self.lock:
+                # Only update counting stats if enabled
                 if self.config.enabled:
-                    self.last_positions = {k: v for k, v in self.last_positions.items() if k in current_ids}
-                    self.counted_ids = {k for k in self.counted_ids if k in current_ids}
+                    self.stats.current_count = in_frame
+                    self.stats.total_tracked = max(self.stats.total_tracked, in_frame)
+            self._last_updated_ts = time.time()
+            self._notify_frame_listeners()
 
-            except Exception as e:
-                print(f"Error in tracking loop for {self.config.name}: {e}")
-                time.sleep(1) # Avoid rapid-fire error loops
-    
-        print(f"Tracking loop stopped for {self.config.name}")
+        except Exception as e:
+            print(f"Error processing frame for {self.config.name}: {e}")
+
+    def _position_rows(self, ids: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Row of each track ID in _pos_arr; IDs seen for the first time get a free row seeded with their center."""
+        rows = np.empty(len(ids), dtype=np.intp)
+        for k, obj_id in enumerate(ids.tolist()):
+            row = self._id_to_row.get(obj_id)
+            if row is None:
+                if not self._free_rows:
+                    # Double the capacity; new rows are handed out lowest first
+                    size = len(self._pos_arr)
+                    self._pos_arr = np.concatenate([self._pos_arr, np.zeros_like(self._pos_arr)])
+                    self._counted = np.concatenate([self._counted, np.zeros_like(self._counted)])
+                    self._free_rows.extend(range(2 * size - 1, size - 1, -1))
+                row = self._id_to_row[obj_id] = self._free_rows.pop()
+                self._pos_arr[row] = centers[k]
+            rows[k] = row
+        return rows
+
+    def _free_ended_rows(self):
+        """Return the rows of IDs the tracker has dropped to the free list.
+
+        Lost tracks keep their rows, so an ID that is re-found resumes from its last position and
+        counted state. With motion gating skipping update() calls, that can be well over 10 seconds.
+        """
+        if not self._id_to_row:
+            return
+        live_ids = live_track_ids(self.tracker)
+        for obj_id in [obj_id for obj_id in self._id_to_row if obj_id not in live_ids]:
+            row = self._id_to_row.pop(obj_id)
+            self._counted[row] = False
+            self._free_rows.append(row)
+
+    def _render_annotation(self, frame: np.ndarray, annotation) -> np.ndarray:
+        """Draw the last detections' boxes, IDs, the counting line and the stats onto a copy of `frame`.
+
+        Frames that skipped detection (motion gating, disabled cameras) get the most recent boxes.
+        """
+        boxes, ids, line, counts = annotation
+        buf = self._annot_buf
+        if buf is None or buf.shape != frame.shape:
+            buf = self._annot_buf = np.empty_like(frame)
+        np.copyto(buf, frame)
+
+        # Basic detection and drawing happens regardless of enabled status
+        draw_boxes(buf, boxes, (0, 255, 0))
+        if ids is not None:
+            self._label_sprites.draw(buf, boxes, ids.tolist())
+
+        # Draw the counting line
+        if line:
+            cv2.line(buf, line[0], line[1], (255, 0, 0), 2)
+
+        # Always show stats
+        self._stats_overlay.draw(buf, counts)
+        return buf
+
+    def _counting_line(self, frame_shape) -> Optional[Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int, int]]]:
+        """Counting line endpoints in pixels plus its (a, b, c) coefficients, so that a*x + b*y + c
+        is positive on the "in" side. Recomputed only when the frame size or line points change."""
+        shape, line_points_id, line = self._line_cache
+        line_points = self.config.line_points
+        if shape != frame_shape[:2] or line_points_id != id(line_points):
+            line = None
+            if line_points and len(line_points) >= 2:
+                frame_height, frame_width = frame_shape[:2]
+                (x1, y1) = p1 = (line_points[0].x * frame_width // 100, line_points[0].y * frame_height // 100)
+                (x2, y2) = p2 = (line_points[1].x * frame_width // 100, line_points[1].y * frame_height // 100)
+                line = (p1, p2, (y1 - y2, x2 - x1, (y2 - y1) * x1 - (x2 - x1) * y1))
+            self._line_cache = (frame_shape[:2], id(line_points), line)
+        return line
+
+    def stats_version(self) -> tuple:
+        """A value that changes whenever get_stats() would return something different."""
+        stats, last_updated_ts = self.stats, self._last_updated_ts
+        # last_updated is formatted to whole seconds
+        return (self.stream_id, stats.camera_name, stats.people_in, stats.people_out, stats.current_count,
+                stats.total_tracked, int(last_updated_ts) if last_updated_ts is not None else None)
 
-    def _get_side(self, p1, p2, point):
-        val = (p2[0] - p1[0]) * (point[1] - p1[1]) - (p2[1] - p1[1]) * (point[0] - p1[0])
-        if val > 0: return 1
-        if val < 0: return -1
-        return 0
-    
     def get_stats(self) -> TrackingStats:
         with self.lock:
-            return self.stats.copy(deep=True)
+            stats = self.stats.model_copy()
+        last_updated_ts = self._last_updated_ts
+        if last_updated_ts is not None:
+            stats.last_updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(last_updated_ts))
+        return stats
         
-    def get_frame(self, annotated: bool = True):
+    def get_jpeg(self, annotated: bool = True) -> Optional[Tuple[int, bytes]]:
+        """Return (frame sequence number, JPEG bytes) for the latest frame, encoding it at most once."""
+        seq, frame_to_return, annotation = self._published
+        # Serve the raw frame until the first frame has been through detection
+        use_annotated = annotated and annotation is not None
+        if frame_to_return is None: return None
+        with self._jpeg_lock:
+            cached = self._jpeg_cache.get(use_annotated)
+            if cached is not None and cached[0] == seq:
+                return cached
+            if use_annotated:
+                # Frames nobody asks for are never drawn on
+                frame_to_return = self._render_annotation(frame_to_return, annotation)
+            jpeg = encode_jpeg(frame_to_return)
+            if jpeg is None:
+                return None
+            self._jpeg_cache[use_annotated] = (seq, jpeg)
+            return seq, jpeg
+
+    def add_frame_listener(self, loop: asyncio.AbstractEventLoop, event: asyncio.Event):
+        """Set `event` on `loop` every time a new frame is published."""
+        with self.lock:
+            self._frame_listeners = self._frame_listeners + [(loop, event)]
+
+    def remove_frame_listener(self, event: asyncio.Event):
         with self.lock:
-            frame_to_return = self.annotated_frame if annotated else self.last_frame
-            if frame_to_return is None: return None
-            ret, buffer = cv2.imencode('.jpg', frame_to_return)
-            return buffer.tobytes() if ret else None
+            self._frame_listeners = [(l, e) for l, e in self._frame_listeners if e is not event]
+
+    def _notify_frame_listeners(self):
+        for loop, event in self._frame_listeners:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
     
     def update_config(self, new_config: CameraConfig):
         with self.lock:
@@ -207,6 +380,7 @@ class CameraTracker:
                               self.config.enabled != new_config.enabled)
             self.config = new_config
             self.stats.camera_name = new_config.name
+            self._line_cache = (None, None, None)
         if should_restart:
             self.stop()
             self.start()
@@ -215,13 +389,231 @@ class CameraTracker:
 class CameraManager:
     """Manages multiple camera trackers"""
     
-    def __init__(self, model_path: str = 'yolov8n.pt', config_file: str = 'cameras.json'):
+    def __init__(self, model_path: str = 'yolov8n.pt', config_file: str = 'cameras.json', int8: bool = False):
+        # Nothing here ever trains. Grad mode is per-thread, so this covers model setup and
+        # graph capture; the inference thread enters inference_mode itself
+        torch.set_grad_enabled(False)
+        # Every batch has the same 640x640 input, so cuDNN's autotuned kernels stay valid
+        torch.backends.cudnn.benchmark = True
+        tracking_kernels.warmup()
+        self.model_path = model_path
         self.model = YOLO(model_path)
+        # On CUDA hosts detection bypasses predict(): the TensorRT FP16 engine, or the PyTorch model
+        # replayed from a CUDA graph, runs straight on the GPU batch
+        self.detector = self._load_detector(model_path) if torch.cuda.is_available() else None
+        # Optional INT8 engine used for every camera that isn't flagged high_accuracy
+        self.int8_detector: Optional[EngineDetector] = None
+        self._calib_remaining = 0
+        self._next_calib_ts = 0.0
+        if int8 and torch.cuda.is_available() and model_path.endswith('.pt'):
+            self._setup_int8()
+        # Frames for a GPU detector are letterboxed into pinned memory and normalized on the GPU
+        self.preprocessor = GpuPreprocessor(IMGSZ, MAX_BATCH, half=HALF_PRECISION) if self.detector is not None else None
+        # Inference runs on its own stream so it doesn't serialize with default-stream work from
+        # other threads (e.g. the background INT8 engine build)
+        self.inference_stream = torch.cuda.Stream() if torch.cuda.is_available() else None
         self.config_file = config_file
         self.trackers: Dict[str, CameraTracker] = {}
+        # Copy-on-write view of self.trackers for lock-free readers. It is rebuilt under
+        # self.lock on every mutation and never modified in place afterwards
+        self._trackers_snapshot: Dict[str, CameraTracker] = {}
         # --- FIX: Use a Re-entrant Lock to prevent deadlocks ---
         self.lock = threading.RLock()
+        self.is_running = True
+        self.frame_cond = threading.Condition()
+        # Bumped on every camera add/update/remove; versions the cached /cameras/ JSON
+        self._config_rev = 0
+        # name -> (version key, revision, JSON bytes) for the list endpoints the dashboard polls.
+        # The prefix keeps ETags from before a restart from matching
+        self._json_cache: Dict[str, tuple] = {}
+        self._json_lock = threading.Lock()
+        self._etag_prefix = uuid4().hex[:8]
         self._load_config()
+        # A single worker runs detection for every camera in one batched call
+        self.inference_thread = threading.Thread(target=self._inference_loop, daemon=True)
+        self.inference_thread.start()
+
+    def _load_detector(self, model_path: str) -> Optional[Union[EngineDetector, GraphedDetector]]:
+        """GPU detector for the model, preferring a TensorRT FP16 engine; None if it can only run through predict()."""
+        if model_path.endswith('.engine'):
+            return EngineDetector(model_path)
+        if not model_path.endswith('.pt'):
+            return None
+
+        engine_path = self._engine_cache_path(model_path, 'fp16')
+        detector = self._load_cached_engine(engine_path)
+        if detector is not None:
+            return detector
+        try:
+            print(f"Exporting {model_path} to TensorRT engine (one-time, this can take a few minutes)...")
+            exported = self.model.export(format='engine', half=True, simplify=True, dynamic=True,
+                                         batch=MAX_BATCH, imgsz=IMGSZ)
+            # Keyed again, now with the TensorRT version the export used
+            engine_path = self._engine_cache_path(model_path, 'fp16')
+            os.makedirs(ENGINE_CACHE_DIR, exist_ok=True)
+            shutil.move(exported, engine_path)
+            return EngineDetector(engine_path)
+        except Exception as e:
+            # TensorRT engines are already launch-optimized; the plain PyTorch model replays its
+            # forward pass from a CUDA graph instead
+            print(f"TensorRT export failed, using PyTorch model instead: {e}")
+            return GraphedDetector(self.model.model, IMGSZ, MAX_BATCH, half=HALF_PRECISION)
+
+    @staticmethod
+    def _engine_cache_path(model_path: str, precision: str) -> str:
+        """Cached engine for these weights, this GPU architecture, TensorRT version, precision, batch size
+        and input size. A serialized engine can only be loaded by the TensorRT version that built it."""
+        digest = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        major, minor = torch.cuda.get_device_capability()
+        try:
+            # Imported here: the first engine export installs TensorRT if it is missing
+            import tensorrt
+            trt_version = tensorrt.__version__
+        except ImportError:
+            trt_version = 'none'
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(ENGINE_CACHE_DIR, f"{name}-{digest.hexdigest()[:16]}-sm{major}{minor}-trt{trt_version}"
+                                              f"-{precision}-b{MAX_BATCH}-{IMGSZ}.engine")
+
+    @staticmethod
+    def _load_cached_engine(engine_path: str) -> Optional[EngineDetector]:
+        """Load a cached engine, deleting it if it can't be deserialized (e.g. the driver changed) so it is rebuilt."""
+        if not os.path.exists(engine_path):
+            return None
+        try:
+            return EngineDetector(engine_path)
+        except Exception as e:
+            print(f"Cached engine {engine_path} failed to load, rebuilding it: {e}")
+            os.remove(engine_path)
+            return None
+
+    @torch.inference_mode()
+    def _inference_loop(self):
+        """Gather the newest frame from every camera and run detection on them as one batch."""
+        print("Inference loop started")
+        while self.is_running:
+            trackers = self._trackers_snapshot.values()
+
+            taken: List[Tuple[CameraTracker, np.ndarray]] = []
+            with self.frame_cond:
+                for tracker in trackers:
+                    frame = tracker.take_frame()
+                    if frame is not None:
+                        taken.append((tracker, frame))
+                if not taken:
+                    # Sleep until any reader publishes a frame (timeout to re-check is_running)
+                    self.frame_cond.wait(timeout=1.0)
+                    continue
+
+            # Disabled cameras between periodic detections and enabled cameras whose scene hasn't
+            # changed only refresh their raw snapshot
+            batch: List[Tuple[CameraTracker, np.ndarray]] = []
+            skipped: List[Tuple[CameraTracker, np.ndarray]] = []
+            for tracker, frame in taken:
+                (batch if tracker.needs_detection(frame) else skipped).append((tracker, frame))
+
+            for tracker, frame in skipped:
+                tracker.store_frame(frame)
+
+            if self._calib_remaining:
+                self._collect_calibration_frames([frame for _, frame in batch])
+
+            # Cameras using the same model are batched together
+            groups: Dict[int, tuple] = {}
+            for tracker, frame in batch:
+                model = self._model_for(tracker)
+                groups.setdefault(id(model), (model, []))[1].append((tracker, frame))
+
+            for model, group in groups.values():
+                for start in range(0, len(group), MAX_BATCH):
+                    chunk = group[start:start + MAX_BATCH]
+                    try:
+                        frames = [frame for _, frame in chunk]
+                        # torch.cuda.stream(None) is a no-op on CPU-only hosts
+                        with torch.cuda.stream(self.inference_stream):
+                            detections_list = self._detect(model, frames)
+                        for (tracker, frame), detections in zip(chunk, detections_list):
+                            tracker.process_result(frame, detections)
+                    except Exception as e:
+                        print(f"Error in inference loop: {e}")
+                        time.sleep(1) # Avoid rapid-fire error loops
+
+        print("Inference loop stopped")
+
+    def _detect(self, model, frames: List[np.ndarray]) -> List[Boxes]:
+        """Run person detection on a batch of frames, returning NumPy boxes in frame coordinates.
+
+        `model` is a GPU detector when there is a preprocessor and a YOLO model otherwise.
+        """
+        if self.preprocessor is None:
+            results = predict_downscaled(model, frames, IMGSZ, [0], HALF_PRECISION)
+            return [Boxes(data, frame.shape[:2]) for frame, data in zip(frames, results)]
+
+        inputs, letterboxes = self.preprocessor(frames)
+        detections = []
+        for frame, letterbox, data in zip(frames, letterboxes, split_to_host(model(inputs, classes=[0]))):
+            data = GpuPreprocessor.restore_boxes(data, letterbox, frame.shape)
+            detections.append(Boxes(data, frame.shape[:2]))
+        return detections
+
+    def _model_for(self, tracker: CameraTracker):
+        if self.detector is None:
+            return self.model
+        if self.int8_detector is not None and not tracker.config.high_accuracy:
+            return self.int8_detector
+        return self.detector
+
+    def _int8_engine_path(self) -> str:
+        return self._engine_cache_path(self.model_path, 'int8')
+
+    def _setup_int8(self):
+        """Load an existing INT8 engine, or start sampling camera frames to calibrate one."""
+        self.int8_detector = self._load_cached_engine(self._int8_engine_path())
+        if self.int8_detector is None:
+            print(f"No INT8 engine yet; collecting {INT8_CALIB_FRAMES} camera frames for calibration...")
+            self._calib_remaining = INT8_CALIB_FRAMES
+
+    def _collect_calibration_frames(self, frames: List[np.ndarray]):
+        """Save sampled frames for INT8 calibration and build the engine once enough are stored."""
+        now = time.monotonic()
+        if now < self._next_calib_ts:
+            return
+        self._next_calib_ts = now + INT8_CALIB_INTERVAL
+
+        image_dir = os.path.join(INT8_CALIB_DIR, 'images')
+        os.makedirs(image_dir, exist_ok=True)
+        for frame in frames[:self._calib_remaining]:
+            self._calib_remaining -= 1
+            cv2.imwrite(os.path.join(image_dir, f"{self._calib_remaining:04d}.jpg"), frame)
+        if self._calib_remaining == 0:
+            threading.Thread(target=self._build_int8_engine, daemon=True).start()
+
+    def _build_int8_engine(self):
+        """Export an INT8 TensorRT engine calibrated on the sampled frames (runs in the background)."""
+        data_yaml = os.path.join(INT8_CALIB_DIR, 'calib.yaml')
+        with open(data_yaml, 'w') as f:
+            yaml.safe_dump({'path': os.path.abspath(INT8_CALIB_DIR), 'train': 'images', 'val': 'images',
+                            'names': dict(self.model.names)}, f)
+
+        # Export from a renamed copy so the intermediate ONNX/engine files don't collide with the FP16 export's
+        int8_weights = os.path.splitext(self.model_path)[0] + '_int8.pt'
+        shutil.copyfile(self.model_path, int8_weights)
+        try:
+            print("Building INT8 TensorRT engine from calibration frames...")
+            exported = YOLO(int8_weights).export(format='engine', int8=True, data=data_yaml, dynamic=True,
+                                                 batch=MAX_BATCH, imgsz=IMGSZ, workspace=4)
+            engine_path = self._int8_engine_path()
+            os.makedirs(ENGINE_CACHE_DIR, exist_ok=True)
+            shutil.move(exported, engine_path)
+            self.int8_detector = EngineDetector(engine_path)
+            print("INT8 engine ready")
+        except Exception as e:
+            print(f"INT8 export failed, staying on the FP16 model: {e}")
+        finally:
+            os.remove(int8_weights)
 
     def _load_config(self):
         try:
@@ -237,17 +629,19 @@ class CameraManager:
 
     def save_config(self):
         with self.lock:
-            configs = {cam_id: tracker.config.dict() for cam_id, tracker in self.trackers.items()}
+            configs = {cam_id: tracker.config.model_dump() for cam_id, tracker in self.trackers.items()}
             with open(self.config_file, 'w') as f:
                 json.dump(configs, f, indent=4)
 
     def add_camera(self, config: CameraConfig, save_to_file: bool = True) -> CameraConfig:
         # Create the tracker instance first.
-        tracker = CameraTracker(config, self.model)
+        tracker = CameraTracker(config, self.frame_cond)
 
         with self.lock:
             # Add the tracker to the dictionary.
             self.trackers[config.camera_id] = tracker
+            self._trackers_snapshot = dict(self.trackers)
+            self._config_rev += 1
             if save_to_file: self.save_config()
         
         # --- START: FIX ---
@@ -262,6 +656,8 @@ class CameraManager:
             if camera_id in self.trackers:
                 self.trackers[camera_id].stop()
                 del self.trackers[camera_id]
+                self._trackers_snapshot = dict(self.trackers)
+                self._config_rev += 1
                 self.save_config()
                 return True
             return False
@@ -277,42 +673,76 @@ class CameraManager:
             
             # Call the tracker's own update method to apply the new config
             tracker.update_config(camera_update)
+            self._config_rev += 1
             # --- END: FIX ---
 
             self.save_config()
             return tracker.config
     
+    # Read paths below use the snapshot (a single attribute load) instead of taking self.lock
+
     def get_camera(self, camera_id: str) -> Optional[CameraConfig]:
-        with self.lock:
-            if camera_id in self.trackers:
-                return self.trackers[camera_id].config
-            return None
+        tracker = self._trackers_snapshot.get(camera_id)
+        return tracker.config if tracker else None
     
     def get_all_cameras(self) -> List[CameraConfig]:
-        with self.lock:
-            return [tracker.config for tracker in self.trackers.values()]
+        return [tracker.config for tracker in self._trackers_snapshot.values()]
 
     def get_all_stats(self) -> List[TrackingStats]:
-        with self.lock:
-            return [tracker.get_stats() for tracker in self.trackers.values()]
+        return [tracker.get_stats() for tracker in self._trackers_snapshot.values()]
+
+    def get_all_cameras_json(self) -> Tuple[str, bytes]:
+        """(ETag, JSON bytes) for get_all_cameras(), re-serialized only after a config change."""
+        return self._cached_json('cameras', self._config_rev,
+                                 lambda: _CAMERA_LIST.dump_json(self.get_all_cameras()))
+
+    def get_all_stats_json(self) -> Tuple[str, bytes]:
+        """(ETag, JSON bytes) for get_all_stats(), re-serialized only when some camera's stats changed."""
+        version = tuple(tracker.stats_version() for tracker in self._trackers_snapshot.values())
+        return self._cached_json('stats', version,
+                                 lambda: _STATS_LIST.dump_json(self.get_all_stats()))
+
+    def _cached_json(self, name: str, version, build) -> Tuple[str, bytes]:
+        with self._json_lock:
+            cached = self._json_cache.get(name)
+            if cached is None or cached[0] != version:
+                revision = cached[1] + 1 if cached is not None else 0
+                cached = self._json_cache[name] = (version, revision, build())
+        return f'W/"{self._etag_prefix}-{name}-{cached[1]}"', cached[2]
 
     # --- ADD THIS METHOD ---
     def get_camera_stats(self, camera_id: str) -> Optional[TrackingStats]:
         """Get tracking statistics for a specific camera."""
-        with self.lock:
-            if camera_id in self.trackers:
-                return self.trackers[camera_id].get_stats()
-            return None
+        tracker = self._trackers_snapshot.get(camera_id)
+        return tracker.get_stats() if tracker else None
     
-    def get_frame(self, camera_id: str, annotated: bool = True) -> Optional[bytes]:
-        if camera_id in self.trackers:
-            return self.trackers[camera_id].get_frame(annotated)
-        return None
+    def get_jpeg(self, camera_id: str, annotated: bool = True) -> Optional[Tuple[str, bytes]]:
+        """Return (ETag, JPEG bytes) for the camera's latest frame; the ETag changes with every new frame."""
+        tracker = self._trackers_snapshot.get(camera_id)
+        jpeg = tracker.get_jpeg(annotated) if tracker else None
+        if jpeg is None:
+            return None
+        seq, frame_bytes = jpeg
+        return f'"{tracker.stream_id}-{int(annotated)}-{seq}"', frame_bytes
+
+    def add_frame_listener(self, camera_id: str, loop: asyncio.AbstractEventLoop, event: asyncio.Event) -> bool:
+        """Have `event` set on `loop` whenever the camera publishes a frame; False if it doesn't exist."""
+        tracker = self._trackers_snapshot.get(camera_id)
+        if tracker is None:
+            return False
+        tracker.add_frame_listener(loop, event)
+        return True
+
+    def remove_frame_listener(self, camera_id: str, event: asyncio.Event):
+        tracker = self._trackers_snapshot.get(camera_id)
+        if tracker is not None:
+            tracker.remove_frame_listener(event)
 
     # --- ADD THIS METHOD ---
     def shutdown(self):
         """Gracefully stop all camera trackers."""
         print("Shutting down all camera trackers...")
+        self.is_running = False
         with self.lock:
             for tracker in self.trackers.values():
                 tracker.stop()
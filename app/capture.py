@@ -0,0 +1,112 @@
+import re
+
+import cv2
+import numpy as np
+from typing import Optional, Tuple, Union
+
+try:
+    import av
+    from av.codec.hwaccel import HWAccel
+except ImportError:  # PyAV is optional; OpenCV's FFmpeg backend is used without it
+    av = None
+
+NETWORK_SCHEMES = ('rtsp://', 'rtsps://', 'http://', 'https://')
+# The user:password@ part of a URL, which must never reach the logs
+URL_USERINFO = re.compile(r'(?<=://)[^/\s]*@')
+
+GSTREAMER_AVAILABLE = any(line.strip().startswith('GStreamer:') and 'YES' in line
+                          for line in cv2.getBuildInformation().splitlines())
+# Tried in order: Jetson's NVDEC element, then whatever decoder decodebin ranks highest
+# (VA-API / v4l2 stateless decoders when installed, software otherwise). appsink keeps only
+# the newest frame so a slow consumer never builds up latency
+GSTREAMER_PIPELINES = (
+    'rtspsrc location={url} latency=0 ! rtph264depay ! h264parse ! nvv4l2decoder ! nvvidconv ! '
+    'video/x-raw,format=BGRx ! videoconvert ! video/x-raw,format=BGR ! appsink max-buffers=1 drop=true sync=false',
+    'rtspsrc location={url} latency=0 ! decodebin ! videoconvert ! video/x-raw,format=BGR ! '
+    'appsink max-buffers=1 drop=true sync=false',
+)
+# Open parameters for OpenCV's FFmpeg backend: let it pick any available hardware decoder
+# (CAP_PROP_HW_DEVICE can't be combined with VIDEO_ACCELERATION_ANY)
+FFMPEG_HW_PARAMS = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+
+def redact_url(text: str) -> str:
+    """Strip credentials from any URLs in the text so it's safe to log."""
+    return URL_USERINFO.sub('', text)
+
+
+class AVCapture:
+    """cv2.VideoCapture-compatible reader that decodes streams with PyAV on NVDEC.
+
+    Only the subset of the VideoCapture API used by CameraTracker is implemented.
+    Decoding happens in grab(); the BGR conversion is deferred to retrieve() so
+    frames that are dropped never pay for it.
+    """
+
+    def __init__(self, url: str):
+        self._container = None
+        self._frames = None
+        self._frame = None
+        options = {'rtsp_transport': 'tcp'} if url.startswith(('rtsp://', 'rtsps://')) else {}
+        try:
+            self._container = av.open(url, options=options, hwaccel=HWAccel(device_type='cuda', allow_software_fallback=True))
+            self._frames = self._container.decode(video=0)
+        except Exception as e:
+            # Decoder errors usually quote the URL too
+            print(f"PyAV could not open {redact_url(url)}: {redact_url(str(e))}")
+            self.release()
+
+    def isOpened(self) -> bool:
+        return self._container is not None
+
+    def grab(self) -> bool:
+        try:
+            self._frame = next(self._frames)
+        except Exception:
+            self._frame = None
+        return self._frame is not None
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._frame is None:
+            return False, None
+        return True, self._frame.to_ndarray(format='bgr24')
+
+    def release(self):
+        if self._container is not None:
+            self._container.close()
+        self._container = None
+        self._frames = None
+        self._frame = None
+
+
+def is_live_source(source: Union[str, int]) -> bool:
+    """Whether a source produces frames in real time (a device or stream) rather than a file read on demand."""
+    if isinstance(source, int):
+        return True
+    return source.isdigit() or source.startswith(NETWORK_SCHEMES + ('rtmp://', 'udp://', '/dev/video'))
+
+
+def source_frame_interval(cap) -> float:
+    """Seconds between frames at the source's native rate, or 0 when it doesn't report one."""
+    fps = cap.get(cv2.CAP_PROP_FPS) if hasattr(cap, 'get') else 0.0
+    return 1.0 / fps if fps and fps > 0 else 0.0
+
+
+def open_capture(source: Union[str, int]):
+    """Open a video source, preferring hardware decode (PyAV, then GStreamer, then FFmpeg's hwaccel)."""
+    if av is not None and isinstance(source, str) and source.startswith(NETWORK_SCHEMES):
+        cap = AVCapture(source)
+        if cap.isOpened():
+            return cap
+    if GSTREAMER_AVAILABLE and isinstance(source, str) and source.startswith(('rtsp://', 'rtsps://')):
+        for pipeline in GSTREAMER_PIPELINES:
+            cap = cv2.VideoCapture(pipeline.format(url=source), cv2.CAP_GSTREAMER)
+            if cap.isOpened():
+                return cap
+    if isinstance(source, str):
+        # FFmpeg backend with whatever hardware decoder it finds (NVDEC, VA-API, QSV, ...); the
+        # acceleration has to be requested at open time, and FFmpeg decodes in software without one
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, FFMPEG_HW_PARAMS)
+        if cap.isOpened():
+            return cap
+    return cv2.VideoCapture(source)
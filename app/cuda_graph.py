@@ -0,0 +1,69 @@
+import torch
+from typing import List, Optional
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # ultralytics < 8.3 keeps NMS in ops
+    from ultralytics.utils.ops import non_max_suppression
+
+# Forward passes run eagerly before capture so cuDNN/cuBLAS pick their kernels and allocate workspaces
+WARMUP_ITERS = 3
+# Same thresholds YOLO.predict() uses by default
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+
+
+class GraphedDetector:
+    """Replays the YOLO forward pass from a CUDA graph instead of launching every kernel.
+
+    A single graph is captured lazily at `max_batch` and smaller batches are zero-padded up
+    to it. One graph per batch size would not be safe: the Detect head rebuilds its anchor
+    and stride tensors whenever the input shape changes, freeing the ones earlier graphs
+    baked in. Callers must pass (N, 3, imgsz, imgsz) batches with N <= max_batch, as
+    produced by GpuPreprocessor.
+    """
+
+    def __init__(self, module: torch.nn.Module, imgsz: int = 640, max_batch: int = 8, half: bool = True,
+                 device: str = 'cuda'):
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if half else torch.float32
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.module = module.to(self.device).fuse(verbose=False).eval()
+        if half:
+            self.module.half()
+        # (graph, static input, static output), captured on first use
+        self._graph: Optional[tuple] = None
+        # Batch size of the previous call; padding slots past it may still hold old frames
+        self._last_n = max_batch
+
+    def __call__(self, inputs: torch.Tensor, classes: Optional[List[int]] = None) -> List[torch.Tensor]:
+        """Return one (k, 6) xyxy/conf/cls tensor per image, in model-input coordinates."""
+        n = inputs.shape[0]
+        if self._graph is None:
+            self._graph = self._capture()
+        graph, static_input, static_output = self._graph
+        static_input[:n].copy_(inputs)
+        if n < self._last_n:
+            static_input[n:self._last_n].zero_()
+        self._last_n = n
+        graph.replay()
+        # NMS reads the output before the next replay can overwrite it, so no clone is needed
+        return non_max_suppression(static_output[:n], CONF_THRESHOLD, IOU_THRESHOLD, classes=classes)
+
+    @torch.no_grad()
+    def _capture(self) -> tuple:
+        static_input = torch.zeros((self.max_batch, 3, self.imgsz, self.imgsz), dtype=self.dtype, device=self.device)
+        side_stream = torch.cuda.Stream(device=self.device)
+        side_stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(side_stream):
+            for _ in range(WARMUP_ITERS):
+                self.module(static_input)
+        torch.cuda.current_stream(self.device).wait_stream(side_stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            output = self.module(static_input)
+        # Detect heads return (predictions, raw feature maps) outside export mode
+        static_output = output[0] if isinstance(output, (list, tuple)) else output
+        return graph, static_input, static_output
@@ -0,0 +1,29 @@
+import torch
+import yaml
+from typing import Set
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+
+# FP16 inference only pays off (and is only supported) on CUDA devices
+HALF_PRECISION = torch.cuda.is_available()
+# Largest batch handed to the model in one call; the TensorRT engine is built for this size
+MAX_BATCH = 8
+# Square model input size, shared by the engine export and the GPU preprocessor
+IMGSZ = 640
+
+
+def create_object_tracker(tracker_cfg: str = 'botsort.yaml'):
+    """Create a standalone BoT-SORT tracker so each camera keeps its own track IDs."""
+    with open(check_yaml(tracker_cfg)) as f:
+        cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+    return TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+
+def live_track_ids(tracker) -> Set[int]:
+    """IDs the tracker may still report: the tracks it follows plus lost ones it is still trying to re-find.
+
+    BoT-SORT drops a lost track only after track_buffer update() calls, however long that takes,
+    so anything keyed by track ID must be kept until the ID leaves both lists.
+    """
+    return {track.track_id for track in tracker.tracked_stracks} | {track.track_id for track in tracker.lost_stracks}
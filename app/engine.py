@@ -0,0 +1,26 @@
+import torch
+from typing import List, Optional
+from ultralytics.nn.autobackend import AutoBackend
+
+from app.cuda_graph import CONF_THRESHOLD, IOU_THRESHOLD, non_max_suppression
+
+
+class EngineDetector:
+    """Runs a TensorRT engine through its ultralytics backend plus NMS, bypassing predict().
+
+    predict() wraps every image in a Results object, which copies the whole input batch
+    back to the host. Here the batch stays on the GPU and only the boxes are returned.
+    Takes the same (N, 3, imgsz, imgsz) batches as GraphedDetector.
+    """
+
+    def __init__(self, engine_path: str, device: str = 'cuda'):
+        # The engine is deserialized here rather than on first use
+        self.backend = AutoBackend(engine_path, device=torch.device(device), fp16=True, verbose=False)
+        self.names = self.backend.names
+
+    def __call__(self, inputs: torch.Tensor, classes: Optional[List[int]] = None) -> List[torch.Tensor]:
+        """Return one (k, 6) xyxy/conf/cls tensor per image, in model-input coordinates."""
+        # The backend only converts towards FP16; INT8 engines may take FP32 input
+        if not self.backend.fp16:
+            inputs = inputs.float()
+        return non_max_suppression(self.backend(inputs), CONF_THRESHOLD, IOU_THRESHOLD, classes=classes)
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+import torch
+from typing import Optional
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo = TurboJPEG()
+except Exception:  # PyTurboJPEG or the libturbojpeg shared library is missing
+    _turbo = None
+
+try:
+    import torchvision
+    from torchvision.io import encode_jpeg as _tv_encode_jpeg
+    # torchvision encodes CUDA tensors with nvJPEG from 0.19 on
+    _nvjpeg = torch.cuda.is_available() and tuple(int(v) for v in torchvision.__version__.split('.')[:2]) >= (0, 19)
+except Exception:
+    _nvjpeg = False
+
+JPEG_QUALITY = 80
+
+
+def _encode_nvjpeg(frame: np.ndarray, quality: int) -> bytes:
+    # HWC BGR -> CHW RGB on the GPU, then encode there; only the compressed bytes come back
+    image = torch.from_numpy(frame).cuda().permute(2, 0, 1).flip(0).contiguous()
+    return _tv_encode_jpeg(image, quality=quality).cpu().numpy().tobytes()
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = JPEG_QUALITY) -> Optional[bytes]:
+    """Encode a BGR frame as JPEG on the GPU with nvJPEG, else with libjpeg-turbo's SIMD encoder, else OpenCV."""
+    global _nvjpeg
+    if _nvjpeg:
+        try:
+            return _encode_nvjpeg(frame, quality)
+        except Exception as e:
+            print(f"nvJPEG encode failed, falling back to the CPU encoder: {e}")
+            _nvjpeg = False
+    if _turbo is not None:
+        return _turbo.encode(frame, quality=quality, pixel_format=TJPF_BGR)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
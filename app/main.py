@@ -1,7 +1,9 @@
-from fastapi import FastAPI, HTTPException, Response
+import asyncio
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 from contextlib import asynccontextmanager  # Import asynccontextmanager
 
 from app.models import CameraConfig, TrackingStats, CameraList
@@ -41,6 +43,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The dashboard compares snapshot ETags to skip decoding unchanged frames
+    expose_headers=["ETag"],
 )
 
 
@@ -50,13 +54,24 @@ async def add_camera(camera: CameraConfig):
     # Access the manager from the app_state
     camera_manager = app_state["camera_manager"]
     new_config = camera_manager.add_camera(camera)
-    return new_config
+    # The body was validated into a CameraConfig already; returning a Response skips
+    # FastAPI's second validation pass against response_model
+    return Response(content=new_config.model_dump_json(), media_type="application/json")
+
+
+def _etag_response(etag: str, content: bytes, media_type: str, if_none_match: Optional[str]) -> Response:
+    """Serve pre-encoded content, or an empty 304 if the client already has this version."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
 
 
 @app.get("/cameras/", tags=["Cameras"], response_model=List[CameraConfig])
-async def get_all_cameras():
+async def get_all_cameras(if_none_match: Optional[str] = Header(None)):
     """Get all camera configurations."""
-    return app_state["camera_manager"].get_all_cameras()
+    etag, content = app_state["camera_manager"].get_all_cameras_json()
+    return _etag_response(etag, content, "application/json", if_none_match)
 
 
 @app.get("/cameras/{camera_id}", tags=["Cameras"], response_model=CameraConfig)
@@ -75,7 +90,7 @@ async def update_camera(camera_id: str, camera: CameraConfig):
     updated_camera = app_state["camera_manager"].update_camera(camera_id, camera)
     if not updated_camera:
         raise HTTPException(status_code=404, detail="Camera not found")
-    return updated_camera
+    return Response(content=updated_camera.model_dump_json(), media_type="application/json")
 
 
 @app.delete("/cameras/{camera_id}", tags=["Cameras"], status_code=204)
@@ -87,9 +102,10 @@ async def delete_camera(camera_id: str):
 
 
 @app.get("/stats/", response_model=List[TrackingStats])
-async def get_all_stats():
+async def get_all_stats(if_none_match: Optional[str] = Header(None)):
     """Get tracking statistics for all cameras."""
-    return app_state["camera_manager"].get_all_stats()
+    etag, content = app_state["camera_manager"].get_all_stats_json()
+    return _etag_response(etag, content, "application/json", if_none_match)
 
 
 @app.get("/stats/{camera_id}", response_model=TrackingStats)
@@ -101,24 +117,51 @@ async def get_camera_stats(camera_id: str):
     return stats
 
 
+async def _mjpeg_frames(camera_id: str, annotated: bool):
+    """Yield a multipart JPEG part each time the camera publishes a new frame."""
+    camera_manager = app_state["camera_manager"]
+    event = asyncio.Event()
+    if not camera_manager.add_frame_listener(camera_id, asyncio.get_running_loop(), event):
+        return
+    last_etag = None
+    try:
+        while True:
+            # Every viewer of the same frame gets the same cached JPEG
+            jpeg = await run_in_threadpool(camera_manager.get_jpeg, camera_id, annotated)
+            # Only send a part when the frame actually changed since the last one this viewer got
+            if jpeg and jpeg[0] != last_etag:
+                last_etag, frame_bytes = jpeg
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(frame_bytes)).encode()
+                       + b"\r\n\r\n" + frame_bytes + b"\r\n")
+            try:
+                await asyncio.wait_for(event.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                # No frames for a while; stop if the camera was removed
+                if camera_manager.get_camera(camera_id) is None:
+                    return
+            event.clear()
+    finally:
+        camera_manager.remove_frame_listener(camera_id, event)
+
+
 # --- FIX: Update the route to match the frontend's request URL ---
 @app.get("/cameras/{camera_id}/stream")
 async def stream_camera(camera_id: str, annotated: bool = True):
-    """Get the video stream for a camera (returns a single frame as JPEG)."""
-    frame_bytes = app_state["camera_manager"].get_frame(camera_id, annotated)
-    # This 'if' statement is being triggered
-    if not frame_bytes:
-        raise HTTPException(status_code=404, detail="Camera not found or stream unavailable")
-    
-    return Response(content=frame_bytes, media_type="image/jpeg")
+    """Stream a camera as MJPEG over one connection, pushing each new frame as it is processed."""
+    if not app_state["camera_manager"].get_camera(camera_id):
+        raise HTTPException(status_code=404, detail="Camera not found")
+    return StreamingResponse(_mjpeg_frames(camera_id, annotated),
+                             media_type="multipart/x-mixed-replace; boundary=frame")
 
 
 @app.get("/cameras/{camera_id}/snapshot")
-async def get_snapshot(camera_id: str, annotated: bool = True):
+async def get_snapshot(camera_id: str, annotated: bool = True, if_none_match: Optional[str] = Header(None)):
     """Get a single snapshot frame from a camera."""
-    frame_bytes = app_state["camera_manager"].get_frame(camera_id, annotated)
-    if not frame_bytes:
+    # JPEG encoding is blocking work; keep it off the event loop
+    jpeg = await run_in_threadpool(app_state["camera_manager"].get_jpeg, camera_id, annotated)
+    if not jpeg:
         raise HTTPException(status_code=404, detail="Camera not found or frame unavailable")
-    
-    # Return the single frame as a JPEG image
-    return Response(content=frame_bytes, media_type="image/jpeg")
\ No newline at end of file
+    etag, frame_bytes = jpeg
+
+    # Return the single frame as a JPEG image; pollers that already have it get a 304
+    return _etag_response(etag, frame_bytes, "image/jpeg", if_none_match)
\ No newline at end of file
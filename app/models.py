@@ -24,6 +24,8 @@ class CameraConfig(BaseModel):
     enabled: bool = True
     # This is what the CameraTracker uses. It supports one line.
     line_points: List[Point] = []
+    # Accuracy-sensitive cameras keep using the FP16 model when an INT8 engine is available.
+    high_accuracy: bool = False
 
     # The 'lines' field and complex validators are no longer needed.
 
@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import torch
+from typing import List, Optional, Tuple
+
+# (gain, pad_x, pad_y) applied to a frame when letterboxing it into the model input
+Letterbox = Tuple[float, int, int]
+
+
+def downscale(frame: np.ndarray, imgsz: int) -> Tuple[np.ndarray, float]:
+    """Shrink a frame so its longer side is `imgsz`, returning it and the factor that maps its
+    coordinates back onto the original. Frames that already fit are returned as they are."""
+    h, w = frame.shape[:2]
+    scale = max(h, w) / imgsz
+    if scale <= 1:
+        return frame, 1.0
+    # INTER_AREA averages the source pixels, so small people don't alias away
+    small = cv2.resize(frame, (round(w / scale), round(h / scale)), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def split_to_host(outputs: List[torch.Tensor]) -> List[np.ndarray]:
+    """Copy per-image detection tensors to the host in one device-to-host transfer, instead of a
+    synchronizing copy per image, and split the result back into one array per image."""
+    splits = np.cumsum([len(output) for output in outputs])[:-1]
+    return np.split(torch.cat(outputs).cpu().numpy(), splits)
+
+
+def predict_downscaled(model, frames: List[np.ndarray], imgsz: int, classes: List[int], half: bool) -> List[np.ndarray]:
+    """Run YOLO.predict() on a batch of frames, returning each frame's (k, 6) xyxy/conf/cls boxes in frame coordinates.
+
+    Frames are shrunk to the model size up front so predict() letterboxes and converts far fewer pixels.
+    """
+    inputs, scales = zip(*(downscale(frame, imgsz) for frame in frames))
+    results = model.predict(list(inputs), imgsz=imgsz, classes=classes, verbose=False, half=half)
+    detections = split_to_host([result.boxes.data for result in results])
+    for data, scale in zip(detections, scales):
+        data[:, :4] *= scale
+    return detections
+
+
+class GpuPreprocessor:
+    """Letterboxes BGR frames and uploads them to the GPU as a normalized RGB batch.
+
+    Frames are written into a pinned staging buffer so the host-to-device copy runs
+    asynchronously on a dedicated CUDA stream; the channel swap, HWC->CHW permute and
+    /255 normalization all happen on the GPU.
+    """
+
+    def __init__(self, imgsz: int = 640, max_batch: int = 8, half: bool = True, device: str = 'cuda'):
+        self.imgsz = imgsz
+        self.device = torch.device(device)
+        dtype = torch.float16 if half else torch.float32
+        self._pinned = torch.empty((max_batch, imgsz, imgsz, 3), dtype=torch.uint8).pin_memory()
+        self._staging = self._pinned.numpy()
+        self._gpu_u8 = torch.empty_like(self._pinned, device=self.device)
+        self._gpu = torch.empty((max_batch, 3, imgsz, imgsz), dtype=dtype, device=self.device)
+        self._stream = torch.cuda.Stream(device=self.device)
+        self._copy_done = torch.cuda.Event()
+        # Letterbox each staging slot was last padded for; the grey border only needs
+        # repainting when a slot receives a frame of a different size
+        self._slot_letterbox: List[Optional[Letterbox]] = [None] * max_batch
+
+    def __call__(self, frames: List[np.ndarray]) -> Tuple[torch.Tensor, List[Letterbox]]:
+        """Return the (N, 3, imgsz, imgsz) input tensor and the letterbox used for each frame."""
+        n = len(frames)
+        # The previous upload must finish before the pinned buffer is overwritten
+        self._copy_done.synchronize()
+
+        letterboxes = []
+        for i, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            gain = min(self.imgsz / h, self.imgsz / w)
+            new_w, new_h = round(w * gain), round(h * gain)
+            pad_x, pad_y = (self.imgsz - new_w) // 2, (self.imgsz - new_h) // 2
+            letterbox = (gain, pad_x, pad_y)
+            if self._slot_letterbox[i] != letterbox:
+                self._staging[i].fill(114)
+                self._slot_letterbox[i] = letterbox
+            # Resize straight into the pinned buffer instead of through a temporary image
+            cv2.resize(frame, (new_w, new_h), dst=self._staging[i, pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                       interpolation=cv2.INTER_LINEAR)
+            letterboxes.append(letterbox)
+
+        with torch.cuda.stream(self._stream):
+            self._gpu_u8[:n].copy_(self._pinned[:n], non_blocking=True)
+            self._copy_done.record()
+            # BHWC BGR uint8 -> BCHW RGB in [0, 1]
+            self._gpu[:n].copy_(self._gpu_u8[:n].permute(0, 3, 1, 2).flip(1)).div_(255)
+        torch.cuda.current_stream(self.device).wait_stream(self._stream)
+        return self._gpu[:n], letterboxes
+
+    @staticmethod
+    def restore_boxes(boxes: np.ndarray, letterbox: Letterbox, frame_shape: Tuple[int, ...]) -> np.ndarray:
+        """Map xyxy boxes (first four columns) from the model input back onto the original frame, in place."""
+        gain, pad_x, pad_y = letterbox
+        height, width = frame_shape[:2]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / gain).clip(0, width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / gain).clip(0, height)
+        return boxes
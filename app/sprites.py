@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+from typing import Dict, Iterable, Optional, Tuple
+
+# (glyph color premultiplied by alpha, 255 - alpha), both uint16 so blending can't overflow
+TextSprite = Tuple[np.ndarray, np.ndarray]
+
+
+def make_sprite(glyphs: np.ndarray, color: Tuple[int, int, int]) -> TextSprite:
+    """Turn a uint8 glyph coverage mask into a sprite that alpha-blends `color` over a frame."""
+    alpha = glyphs[:, :, None].astype(np.uint16)
+    return alpha * np.array(color, dtype=np.uint16), 255 - alpha
+
+
+def text_sprite(text: str, scale: float, color: Tuple[int, int, int], thickness: int = 2) -> Tuple[TextSprite, int]:
+    """Render one line of Hershey Simplex text into a sprite; also returns the text height.
+
+    The glyphs start 2px in from the sprite's left and top edges, so blitting at
+    (x - 2, y - 2 - height) puts the text where cv2.putText(..., (x, y), ...) would.
+    """
+    (width, height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    # 2px margin so the stroke thickness isn't clipped
+    glyphs = np.zeros((height + baseline + 4, width + 4), dtype=np.uint8)
+    cv2.putText(glyphs, text, (2, 2 + height), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+    return make_sprite(glyphs, color), height
+
+
+def blit_sprite(frame: np.ndarray, sprite: TextSprite, x: int, y: int):
+    """Blend a sprite onto the frame with its top-left corner at (x, y), clipped to the frame."""
+    tinted, inv_alpha = sprite
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + tinted.shape[1], frame.shape[1]), min(y + tinted.shape[0], frame.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return
+    roi = frame[y0:y1, x0:x1]
+    src = np.s_[y0 - y:y1 - y, x0 - x:x1 - x]
+    roi[:] = (roi * inv_alpha[src] + tinted[src]) // 255
+
+
+def draw_boxes(frame: np.ndarray, boxes: np.ndarray, color: Tuple[int, int, int], thickness: int = 2):
+    """Draw (N, 4) integer xyxy boxes with one cv2.polylines call instead of a cv2.rectangle each."""
+    if len(boxes) == 0:
+        return
+    # Corners clockwise from the top left: (x1, y1), (x2, y1), (x2, y2), (x1, y2)
+    corners = np.ascontiguousarray(boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]], dtype=np.int32).reshape(-1, 4, 2)
+    cv2.polylines(frame, corners, True, color, thickness)
+
+
+# ID label sprites kept per camera before the cache is reset
+MAX_LABEL_SPRITES = 1024
+
+
+class LabelSprites:
+    """Box labels ("ID 7") rasterized once per track ID and blitted above each box."""
+
+    def __init__(self, text_format: str, color: Tuple[int, int, int]):
+        self.text_format = text_format
+        self.color = color
+        # Track ID -> (sprite, text height)
+        self._sprites: Dict[int, Tuple[TextSprite, int]] = {}
+
+    def draw(self, frame: np.ndarray, boxes: np.ndarray, ids: Iterable[int]):
+        """Label each (x1, y1, x2, y2) box with its ID where cv2.putText would put it, 10px above the box."""
+        for (x1, y1, _, _), obj_id in zip(boxes.tolist(), ids):
+            cached = self._sprites.get(obj_id)
+            if cached is None:
+                if len(self._sprites) >= MAX_LABEL_SPRITES:
+                    self._sprites.clear()
+                cached = self._sprites[obj_id] = text_sprite(self.text_format.format(obj_id), 0.5, self.color)
+            sprite, text_height = cached
+            blit_sprite(frame, sprite, x1 - 2, y1 - 12 - text_height)
+
+
+class StatsOverlay:
+    """The In / Out / In Frame counts in a frame's top-left corner, re-rendered only when a count changes."""
+
+    def __init__(self, color: Tuple[int, int, int]):
+        self.color = color
+        self._counts = None
+        self._sprite: Optional[TextSprite] = None
+
+    def draw(self, frame: np.ndarray, counts: Tuple[int, int, int]):
+        if self._sprite is None or self._counts != counts:
+            lines = [f"In: {counts[0]}", f"Out: {counts[1]}", f"In Frame: {counts[2]}"]
+            width = 12 + max(cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0][0] for text in lines)
+            glyphs = np.zeros((125, width), dtype=np.uint8)
+            for i, text in enumerate(lines):
+                cv2.putText(glyphs, text, (10, 30 + 40 * i), cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2)
+            # Alpha-blend the glyphs so the video stays visible behind the text
+            self._counts, self._sprite = counts, make_sprite(glyphs, self.color)
+        blit_sprite(frame, self._sprite, 0, 0)
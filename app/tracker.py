@@ -1,11 +1,47 @@
+import os
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
+from ultralytics.engine.results import Boxes
+import queue
 import threading
 import time
 import uuid
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple, Set
 
+from app.capture import is_live_source, open_capture, source_frame_interval
+from app.detection import HALF_PRECISION, IMGSZ, MAX_BATCH, create_object_tracker, live_track_ids
+from app.jpeg import encode_jpeg
+from app.preprocess import predict_downscaled
+from app.sprites import LabelSprites, StatsOverlay, draw_boxes
+
+# Annotated frame buffers reused round-robin per camera. A reader holding the published
+# buffer has two more frames' time before the writer comes back around to it
+FRAME_POOL_SIZE = 3
+# Detection results buffered for the annotate stage; the oldest is dropped when it falls behind
+STAGE_QUEUE_SIZE = 2
+# How long (seconds) to wait for more cameras to fill a batch
+BATCH_WINDOW = 0.01
+# Ultralytics dataset used to calibrate the CPU INT8 export
+INT8_CALIB_DATA = 'coco8.yaml'
+# Track IDs remembered per camera; past this the least recently seen are forgotten even if still tracked
+MAX_TRACKED_IDS = 1024
+
+
+def _put_latest(q: queue.Queue, item):
+    """Put without blocking, discarding the oldest queued item if the queue is full."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
 
 class LineCounter:
     def __init__(self, id: str, start_point: Tuple[int, int], end_point: Tuple[int, int], name: str = ""):
@@ -16,28 +52,38 @@ class LineCounter:
         self.counted_ids = set()
         self.count_in = 0
         self.count_out = 0
+        # ((line_start, line_end), (A, B, C)) for the last pixel end points the line was used with
+        self._coefficients = (None, None)
         
+    def coefficients(self, line_start: Tuple[int, int], line_end: Tuple[int, int]) -> Tuple[int, int, int]:
+        """A, B, C of the line equation Ax + By + C = 0 through the given end points.
+
+        The end points only change with the frame size, so the result is cached.
+        """
+        key, coefficients = self._coefficients
+        if key != (line_start, line_end):
+            x1, y1 = line_start
+            x2, y2 = line_end
+            coefficients = (y2 - y1, x1 - x2, x2 * y1 - x1 * y2)
+            self._coefficients = ((line_start, line_end), coefficients)
+        return coefficients
+
+    def absolute_points(self, frame_width: int, frame_height: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """Convert the line's relative (percentage) points to absolute pixel coordinates."""
+        return ((int(self.start_point[0] * frame_width / 100), int(self.start_point[1] * frame_height / 100)),
+                (int(self.end_point[0] * frame_width / 100), int(self.end_point[1] * frame_height / 100)))
+
     def is_crossing(self, current_point: Tuple[int, int], previous_point: Optional[Tuple[int, int]], 
                       line_start: Tuple[int, int], line_end: Tuple[int, int]) -> Optional[str]:
         """Determine if a point has crossed the line and in which direction"""
         if previous_point is None:
             return None
             
-        x1, y1 = line_start
-        x2, y2 = line_end
-        
-        # Current and previous positions
-        cx, cy = current_point
-        px, py = previous_point
-        
-        # Line equation: Ax + By + C = 0
-        A = y2 - y1
-        B = x1 - x2
-        C = x2 * y1 - x1 * y2
+        A, B, C = self.coefficients(line_start, line_end)
         
         # Check which side the current and previous points are on
-        current_side = A * cx + B * cy + C
-        previous_side = A * px + B * py + C
+        current_side = A * current_point[0] + B * current_point[1] + C
+        previous_side = A * previous_point[0] + B * previous_point[1] + C
         
         # If the signs are different, a crossing has occurred
         if current_side * previous_side < 0:
@@ -53,12 +99,31 @@ class LineCounter:
 
 
 class PeopleTracker:
-    def __init__(self, model_path: str = 'yolov8n.pt'):
+    def __init__(self, model_path: str = 'yolov8n.pt', int8: bool = False):
         """Initialize the tracker with a specified model"""
-        self.model = YOLO(model_path)
+        self.model = self._load_model(model_path, int8)
         self.cameras = {}
         self.tracking_history = {}  # Track position history for each object
         self.lock = threading.RLock()  # Thread safety
+        # Guards every camera's "pending" slot; the detector waits on it for captured frames
+        self.frame_cond = threading.Condition()
+        threading.Thread(target=self._batch_detect_loop, daemon=True).start()
+
+    @staticmethod
+    def _load_model(model_path: str, int8: bool) -> YOLO:
+        """Load the YOLO model; without CUDA, optionally as an OpenVINO INT8 export for faster CPU inference."""
+        if not int8 or torch.cuda.is_available() or not model_path.endswith('.pt'):
+            return YOLO(model_path)
+        # Exported once next to the weights and reused on later starts
+        openvino_path = f"{os.path.splitext(model_path)[0]}_int8_openvino_model"
+        if not os.path.isdir(openvino_path):
+            try:
+                print(f"Exporting {model_path} to OpenVINO INT8...")
+                openvino_path = YOLO(model_path).export(format='openvino', int8=True, data=INT8_CALIB_DATA)
+            except Exception as e:
+                print(f"OpenVINO INT8 export failed, using {model_path}: {e}")
+                return YOLO(model_path)
+        return YOLO(openvino_path, task='detect')
 
     def add_camera(self, camera_id: str, source) -> bool:
         """Add a camera source to the tracker"""
@@ -68,7 +133,7 @@ class PeopleTracker:
                     return False
                     
                 # Handle different source types (int, string)
-                cap = cv2.VideoCapture(source)
+                cap = open_capture(source)
                 if not cap.isOpened():
                     return False
                     
@@ -76,23 +141,41 @@ class PeopleTracker:
                     "source": source,
                     "cap": cap,
                     "lines": {},
+                    # ((width, height), (lines, absolute points, ABC matrix)); reset when lines change
+                    "line_geometry": None,
                     "enabled": True,
-                    "last_frame": None,
-                    "last_processed_frame": None,
+                    # (seq, newest frame) slots, each replaced whole by its one writer thread so
+                    # readers never lock. seq is bumped on every store and keys the JPEG cache
+                    "raw": (0, None),
+                    "annotated": (0, None),
+                    # with_annotations -> (seq, JPEG bytes) of the last frame encoded
+                    "jpeg_cache": {},
                     "stats": {
                         "people_in": 0,
                         "people_out": 0,
-                        "current_count": 0
+                        "current_count": 0,
+                        # Frames replaced in the pending slot before detection got to them
+                        "frames_skipped": 0
                     },
                     "last_positions": {},  # Last detected positions of each person
+                    # Track IDs with a position or counted state, least recently seen first
+                    "recent_ids": OrderedDict(),
+                    # Per-camera tracker so IDs don't mix between cameras sharing a batch
+                    "tracker": create_object_tracker(),
+                    # Pre-rendered text for the annotated frames
+                    "stats_overlay": StatsOverlay((0, 255, 255)),
+                    "label_sprites": LabelSprites("ID: {}", (255, 0, 0)),
+                    "annotated_pool": [None] * FRAME_POOL_SIZE,
+                    "pool_idx": 0,
+                    # capture -> batched detect (shared) -> annotate. The capture stage keeps only its
+                    # newest frame, as (capture time, frame), so one busy camera can't crowd out others
+                    "pending": None,
+                    "detect_q": queue.Queue(maxsize=STAGE_QUEUE_SIZE),
                 }
                 
-                # Start processing thread for this camera
-                threading.Thread(
-                    target=self._process_camera_feed,
-                    args=(camera_id,),
-                    daemon=True
-                ).start()
+                # Start the processing pipeline for this camera
+                for stage in (self._capture_loop, self._process_camera_feed):
+                    threading.Thread(target=stage, args=(camera_id,), daemon=True).start()
                 
                 return True
                 
@@ -126,6 +209,7 @@ class PeopleTracker:
                 end_point=end_point,
                 name=name
             )
+            self.cameras[camera_id]["line_geometry"] = None
             return True
 
     def remove_line(self, camera_id: str, line_id: str) -> bool:
@@ -135,6 +219,7 @@ class PeopleTracker:
                 return False
                 
             del self.cameras[camera_id]["lines"][line_id]
+            self.cameras[camera_id]["line_geometry"] = None
             return True
 
     def get_camera_stats(self, camera_id: str) -> Optional[Dict]:
@@ -145,92 +230,235 @@ class PeopleTracker:
                 
             return self.cameras[camera_id]["stats"].copy()
 
+    @staticmethod
+    def _latest(camera_data: Dict, with_annotations: bool) -> Tuple[bool, int, Optional[np.ndarray]]:
+        """(annotated?, seq, frame) for a camera's newest frame, read without taking the lock."""
+        # Each slot is replaced by its single writer with one item store, so reading
+        # it once gives a consistent (seq, frame) pair
+        if with_annotations:
+            seq, frame = camera_data["annotated"]
+            if frame is not None:
+                return True, seq, frame
+        seq, frame = camera_data["raw"]
+        return False, seq, frame
+
     def get_latest_frame(self, camera_id: str, with_annotations: bool = True) -> Optional[np.ndarray]:
-        """Get the latest frame from a camera, with or without tracking annotations"""
-        with self.lock:
-            if camera_id not in self.cameras:
-                return None
-                
-            if with_annotations and self.cameras[camera_id]["last_processed_frame"] is not None:
-                return self.cameras[camera_id]["last_processed_frame"].copy()
-            elif self.cameras[camera_id]["last_frame"] is not None:
-                return self.cameras[camera_id]["last_frame"].copy()
-            
+        """Get the latest frame from a camera, with or without tracking annotations.
+
+        The returned array is a pooled buffer, not a copy: encode or copy it right away and don't modify it.
+        """
+        camera_data = self.cameras.get(camera_id)
+        return self._latest(camera_data, with_annotations)[2] if camera_data is not None else None
+
+    def get_latest_jpeg(self, camera_id: str, with_annotations: bool = True) -> Optional[Tuple[int, bytes]]:
+        """Get (frame sequence number, JPEG bytes) for the latest frame, encoding each frame at most once."""
+        camera_data = self.cameras.get(camera_id)
+        if camera_data is None:
+            return None
+        annotated, seq, frame = self._latest(camera_data, with_annotations)
+        if frame is None:
             return None
+        jpeg_cache = camera_data["jpeg_cache"]
+        cached = jpeg_cache.get(annotated)
+        if cached is not None and cached[0] == seq:
+            return cached
 
-    def _process_camera_feed(self, camera_id: str):
-        """Process frames from a camera feed (runs in separate thread)"""
+        # The pooled buffer isn't reused for another two frames, long enough to encode it
+        jpeg = encode_jpeg(frame)
+        if jpeg is None:
+            return None
+        # Concurrent requests for a new frame may both encode it; either result is correct
+        jpeg_cache[annotated] = (seq, jpeg)
+        return seq, jpeg
+
+    def _line_geometry(self, camera_data: Dict, frame_width: int, frame_height: int) -> Tuple[List[LineCounter], List[tuple], np.ndarray]:
+        """Return the camera's lines, their absolute end points and an (L, 3) matrix of A, B, C coefficients.
+
+        Line points are stored as percentages of the frame, so the result is cached per frame size
+        and rebuilt whenever a line is added or removed.
+        """
+        # Under the lock so a line added mid-rebuild can't be overwritten by stale geometry
+        with self.lock:
+            cached = camera_data["line_geometry"]
+            if cached is not None and cached[0] == (frame_width, frame_height):
+                return cached[1]
+            line_counters = list(camera_data["lines"].values())
+            # --- FIX: Convert relative line points to absolute pixel coordinates ---
+            line_points = [line_counter.absolute_points(frame_width, frame_height) for line_counter in line_counters]
+            lines_abc = np.array([line_counter.coefficients(*points) for line_counter, points in zip(line_counters, line_points)],
+                                 dtype=np.int64).reshape(-1, 3)
+            geometry = (line_counters, line_points, lines_abc)
+            camera_data["line_geometry"] = ((frame_width, frame_height), geometry)
+            return geometry
+
+    @staticmethod
+    def _forget_ended_tracks(camera_data: Dict, line_counters: List[LineCounter], live_ids: Set[int]):
+        """Forget track IDs the tracker has dropped, then the least recently seen past MAX_TRACKED_IDS,
+        so the position history and every line's counted_ids stay bounded.
+
+        A lost ID is kept however long it stays lost: if it is re-found, it can still be counted "out".
+        """
+        recent_ids = camera_data["recent_ids"]
+        ended = [obj_id for obj_id in recent_ids if obj_id not in live_ids]
+        for obj_id in ended:
+            del recent_ids[obj_id]
+        while len(recent_ids) > MAX_TRACKED_IDS:
+            ended.append(recent_ids.popitem(last=False)[0])
+        for obj_id in ended:
+            camera_data["last_positions"].pop(obj_id, None)
+            for line_counter in line_counters:
+                line_counter.counted_ids.discard(obj_id)
+
+    def _capture_loop(self, camera_id: str):
+        """Read frames from a camera into its pipeline (first stage, runs in its own thread)"""
         camera_data = self.cameras[camera_id]
         cap = camera_data["cap"]
-        
+        live = is_live_source(camera_data["source"])
+        frame_interval = source_frame_interval(cap)
+        next_read_ts = 0.0
+
         while camera_id in self.cameras and camera_data["enabled"]:
             try:
+                if not live:
+                    # Paced like CameraTracker's reader: wait for the pending slot to empty, then for the file's frame rate
+                    with self.frame_cond:
+                        self.frame_cond.wait_for(lambda: camera_data["pending"] is None, timeout=1)
+                    delay = next_read_ts - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_read_ts = time.monotonic() + frame_interval
+
                 ret, frame = cap.read()
                 if not ret:
                     # Try to reconnect
                     time.sleep(1)
-                    cap = cv2.VideoCapture(camera_data["source"])
+                    cap = open_capture(camera_data["source"])
+                    frame_interval = source_frame_interval(cap)
                     continue
 
-                # Store the raw frame
-                with self.lock:
-                    camera_data["last_frame"] = frame.copy()
-                
-                # Perform object detection and tracking
-                results = self.model.track(frame, persist=True, classes=[0])  # Class 0 is for 'person'
-                
-                # Create a copy for annotations
-                annotated_frame = frame.copy()
+                # Store the raw frame; every read returns a new array, so no copy is needed
+                camera_data["raw"] = (camera_data["raw"][0] + 1, frame)
+                with self.frame_cond:
+                    if camera_data["pending"] is not None:
+                        camera_data["stats"]["frames_skipped"] += 1
+                    camera_data["pending"] = (time.monotonic(), frame)
+                    self.frame_cond.notify_all()
+
+            except Exception as e:
+                print(f"Error reading camera {camera_id}: {e}")
+                time.sleep(1)
+
+    def _pending_count(self) -> int:
+        return sum(camera_data["pending"] is not None for camera_data in list(self.cameras.values()))
+
+    def _take_pending(self) -> List[Tuple[str, np.ndarray]]:
+        """Empty up to MAX_BATCH pending slots, longest-waiting first (caller holds frame_cond)."""
+        pending = [(camera_data["pending"][0], camera_id, camera_data)
+                   for camera_id, camera_data in list(self.cameras.items()) if camera_data["pending"] is not None]
+        batch = []
+        for _, camera_id, camera_data in sorted(pending, key=lambda p: p[0])[:MAX_BATCH]:
+            batch.append((camera_id, camera_data["pending"][1]))
+            camera_data["pending"] = None
+        # Wakes file readers waiting for their slot to empty
+        self.frame_cond.notify_all()
+        return batch
+
+    def _batch_detect_loop(self):
+        """Detect people on frames from all cameras in one model call, then track per camera (shared stage)"""
+        while True:
+            with self.frame_cond:
+                if not self.frame_cond.wait_for(lambda: self._pending_count() > 0, timeout=1):
+                    continue
+                # Give the other cameras a moment to contribute to the batch
+                full = min(len(self.cameras), MAX_BATCH)
+                self.frame_cond.wait_for(lambda: self._pending_count() >= full, timeout=BATCH_WINDOW)
+                batch = self._take_pending()
+
+            try:
+                # Perform object detection for the whole batch
+                detections = predict_downscaled(self.model, [frame for _, frame in batch], IMGSZ, [0], HALF_PRECISION)  # Class 0 is for 'person'
+                for (camera_id, frame), data in zip(batch, detections):
+                    camera_data = self.cameras.get(camera_id)
+                    if camera_data is None:
+                        continue
+                    tracker = camera_data["tracker"]
+                    tracks = tracker.update(Boxes(data, frame.shape[:2]), frame)
+                    # IDs still alive as of this update, taken here so the annotate stage never reads the tracker
+                    _put_latest(camera_data["detect_q"], (frame, tracks, live_track_ids(tracker)))
+            except Exception as e:
+                print(f"Error in batched detection: {e}")
+                time.sleep(1)
+
+    def _process_camera_feed(self, camera_id: str):
+        """Count and annotate detection results for a camera (last stage, runs in its own thread)"""
+        camera_data = self.cameras[camera_id]
+        
+        while camera_id in self.cameras and camera_data["enabled"]:
+            try:
+                frame, tracks, live_ids = camera_data["detect_q"].get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                idx = camera_data["pool_idx"]
+                camera_data["pool_idx"] = (idx + 1) % FRAME_POOL_SIZE
+
+                # Draw into this slot's annotation buffer so the raw frame stays clean
+                annotated_frame = camera_data["annotated_pool"][idx]
+                if annotated_frame is None or annotated_frame.shape != frame.shape:
+                    annotated_frame = camera_data["annotated_pool"][idx] = np.empty_like(frame)
+                np.copyto(annotated_frame, frame)
                 
                 frame_height, frame_width, _ = annotated_frame.shape # Get frame dimensions
 
                 current_count = 0
                 
-                if results[0].boxes.id is not None:
-                    boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-                    ids = results[0].boxes.id.cpu().numpy().astype(int)
+                line_counters, line_points, lines_abc = self._line_geometry(camera_data, frame_width, frame_height)
+
+                # Tracks are [x1, y1, x2, y2, id, score, cls, idx] rows
+                if len(tracks) > 0:
+                    # One cast for boxes and IDs together
+                    boxes_ids = tracks[:, :5].astype(int)
+                    boxes, ids = boxes_ids[:, :4], boxes_ids[:, 4]
                     
                     current_count = len(ids)
-                    
-                    # Process each detected person
-                    for box, obj_id in zip(boxes, ids):
-                        x1, y1, x2, y2 = box
-                        
-                        # Calculate center of the bounding box
-                        center_x = (x1 + x2) // 2
-                        center_y = (y1 + y2) // 2
-                        current_position = (center_x, center_y)
-                        
-                        # Draw bounding box and ID
-                        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                        cv2.putText(annotated_frame, f'ID: {obj_id}', 
-                                   (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-                        
-                        # Get previous position for this object
-                        str_id = str(obj_id)
-                        previous_position = camera_data["last_positions"].get(str_id)
-                        
-                        # Update the position history
-                        camera_data["last_positions"][str_id] = current_position
-                        
-                        # Check line crossings for this object
-                        for line_id, line_counter in camera_data["lines"].items():
-                            if previous_position:
-                                # --- FIX: Convert relative line points to absolute pixel coordinates ---
-                                p1_abs = (int(line_counter.start_point[0] * frame_width / 100), int(line_counter.start_point[1] * frame_height / 100))
-                                p2_abs = (int(line_counter.end_point[0] * frame_width / 100), int(line_counter.end_point[1] * frame_height / 100))
-
-                                # Use absolute points for crossing check
-                                crossing = line_counter.is_crossing(current_position, previous_position, p1_abs, p2_abs)
-                                
-                                if crossing == "in" and str_id not in line_counter.counted_ids:
-                                    line_counter.count_in += 1
-                                    line_counter.counted_ids.add(str_id)
-                                    
-                                elif crossing == "out" and str_id in line_counter.counted_ids:
-                                    line_counter.count_out += 1
-                                    line_counter.counted_ids.remove(str_id)
+                    # Plain ints key the position history and counted sets, no str() per person
+                    id_list = ids.tolist()
+
+                    # Calculate the center of every bounding box at once
+                    centers = (boxes_ids[:, 0:2] + boxes_ids[:, 2:4]) >> 1
+
+                    # Previous positions, where known, then update the position history
+                    last_positions = camera_data["last_positions"]
+                    previous = [last_positions.get(obj_id) for obj_id in id_list]
+                    has_previous = np.array([p is not None for p in previous])
+                    previous = np.array([p if p is not None else (0, 0) for p in previous]).reshape(-1, 2)
+                    recent_ids = camera_data["recent_ids"]
+                    for obj_id, center in zip(id_list, centers.tolist()):
+                        last_positions[obj_id] = center
+                        recent_ids[obj_id] = None
+                        recent_ids.move_to_end(obj_id)
+
+                    # Side of every line for every person, (K, L), now and in the previous frame;
+                    # a sign change is a crossing and the current sign gives the direction
+                    if line_counters:
+                        current_side = centers @ lines_abc[:, :2].T + lines_abc[:, 2]
+                        previous_side = previous @ lines_abc[:, :2].T + lines_abc[:, 2]
+                        crossings = (current_side * previous_side < 0) & has_previous[:, None]
+                        for k, l in zip(*np.nonzero(crossings)):
+                            line_counter, obj_id = line_counters[l], id_list[k]
+                            if current_side[k, l] > 0 and obj_id not in line_counter.counted_ids:
+                                line_counter.count_in += 1
+                                line_counter.counted_ids.add(obj_id)
+                            elif current_side[k, l] < 0 and obj_id in line_counter.counted_ids:
+                                line_counter.count_out += 1
+                                line_counter.counted_ids.remove(obj_id)
+
+                    # Draw bounding boxes and IDs; each ID's label is rasterized once and then blitted
+                    draw_boxes(annotated_frame, boxes, (255, 0, 0))
+                    camera_data["label_sprites"].draw(annotated_frame, boxes, id_list)
                 
+                self._forget_ended_tracks(camera_data, line_counters, live_ids)
+
                 # --- START: NEW DRAWING LOGIC ---
                 # Update total stats
                 total_in = sum(line.count_in for line in camera_data["lines"].values())
@@ -240,19 +468,14 @@ class PeopleTracker:
                 camera_data["stats"]["current_count"] = current_count
 
                 # Draw all counting lines
-                for line_counter in camera_data["lines"].values():
-                    p1_abs = (int(line_counter.start_point[0] * frame_width / 100), int(line_counter.start_point[1] * frame_height / 100))
-                    p2_abs = (int(line_counter.end_point[0] * frame_width / 100), int(line_counter.end_point[1] * frame_height / 100))
+                for p1_abs, p2_abs in line_points:
                     cv2.line(annotated_frame, p1_abs, p2_abs, (0, 255, 0), 2)
 
                 # Display total stats on frame
-                cv2.putText(annotated_frame, f'In: {total_in}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-                cv2.putText(annotated_frame, f'Out: {total_out}', (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-                cv2.putText(annotated_frame, f'In Frame: {current_count}', (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+                camera_data["stats_overlay"].draw(annotated_frame, (total_in, total_out, current_count))
                 # --- END: NEW DRAWING LOGIC ---
 
-                with self.lock:
-                    camera_data["last_processed_frame"] = annotated_frame.copy()
+                camera_data["annotated"] = (camera_data["annotated"][0] + 1, annotated_frame)
                     
             except Exception as e:
                 print(f"Error processing camera {camera_id}: {e}")
@@ -0,0 +1,59 @@
+import numpy as np
+from typing import Tuple
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the NumPy implementation below is used without it
+    njit = None
+
+
+def _count_crossings_numpy(pos: np.ndarray, counted: np.ndarray, rows: np.ndarray, centers: np.ndarray,
+                           a: int, b: int, c: int) -> Tuple[int, int]:
+    """Vectorized equivalent of _count_crossings_loop."""
+    v_prev = a * pos[rows, 0] + b * pos[rows, 1] + c
+    v_curr = a * centers[:, 0] + b * centers[:, 1] + c
+    crossed = np.sign(v_prev) != np.sign(v_curr)
+    went_in = crossed & (v_curr > 0) & ~counted[rows]
+    went_out = crossed & (v_curr < 0) & counted[rows]
+    counted[rows[went_in]] = True
+    counted[rows[went_out]] = False
+    pos[rows] = centers
+    return int(went_in.sum()), int(went_out.sum())
+
+
+def _count_crossings_loop(pos, counted, rows, centers, a, b, c):
+    """Count line crossings for one frame and move every track to its new center.
+
+    `rows` index `pos` (last centers) and `counted` (whether the track was counted "in") for the
+    tracks in `centers`. Moving onto the side of the line where a*x + b*y + c > 0 counts as in,
+    and back to the negative side as out. Both arrays are updated in place; returns (in, out).
+    """
+    people_in = 0
+    people_out = 0
+    for k in range(rows.shape[0]):
+        row = rows[k]
+        v_prev = a * pos[row, 0] + b * pos[row, 1] + c
+        v_curr = a * centers[k, 0] + b * centers[k, 1] + c
+        if np.sign(v_prev) != np.sign(v_curr):
+            if v_curr > 0 and not counted[row]:
+                people_in += 1
+                counted[row] = True
+            elif v_curr < 0 and counted[row]:
+                people_out += 1
+                counted[row] = False
+        pos[row, 0] = centers[k, 0]
+        pos[row, 1] = centers[k, 1]
+    return people_in, people_out
+
+
+if njit is not None:
+    count_crossings = njit(cache=True, nogil=True)(_count_crossings_loop)
+else:
+    count_crossings = _count_crossings_numpy
+
+
+def warmup():
+    """Compile the Numba kernel up front so the first tracked frame doesn't stall on it."""
+    pos = np.zeros((1, 2), dtype=np.int32)
+    count_crossings(pos, np.zeros(1, dtype=bool), np.zeros(1, dtype=np.intp),
+                    np.zeros((1, 2), dtype=np.int64), 0, 1, 0)
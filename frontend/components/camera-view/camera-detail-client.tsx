@@ -54,7 +54,7 @@ export function CameraDetailClient({ initialCamera, initialStats }: CameraDetail
         <TabsContent value="live" className="mt-4">
           <div className="grid grid-cols-1 lg:grid-cols-[2fr_1fr] gap-8">
             <div>
-              <StreamView camera={camera} />
+              <StreamView camera={camera} live />
             </div>
             <div>
               <Card>
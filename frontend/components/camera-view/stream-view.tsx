@@ -1,26 +1,74 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { CameraConfig } from '@/types';
 
+// How often grid thumbnails re-check the snapshot; unchanged frames come back as an empty 304
+const SNAPSHOT_INTERVAL_MS = 500;
+
 interface StreamViewProps {
   camera: CameraConfig;
   annotated?: boolean;
+  // Live views hold an MJPEG connection open. Browsers allow only ~6 connections per host,
+  // so grids of cameras poll the snapshot endpoint instead.
+  live?: boolean;
 }
 
-export function StreamView({ camera, annotated = true }: StreamViewProps) {
+export function StreamView({ camera, annotated = true, live = false }: StreamViewProps) {
   const [imageUrl, setImageUrl] = useState('');
   const [hasError, setHasError] = useState(false);
+  // Last <img> rendered; kept after React detaches it so the stream can still be closed on unmount
+  const imgRef = useRef<HTMLImageElement | null>(null);
 
   useEffect(() => {
-    const baseUrl = `${process.env.NEXT_PUBLIC_API_URL}/cameras/${camera.camera_id}/stream?annotated=${annotated}`;
-    const updateImage = () => {
-      setImageUrl(`${baseUrl}&t=${new Date().getTime()}`);
+    const baseUrl = `${process.env.NEXT_PUBLIC_API_URL}/cameras/${camera.camera_id}`;
+    setHasError(false);
+
+    if (live) {
+      // One connection keeps delivering frames, so no polling. The timestamp only makes
+      // sure a fresh connection is opened when the camera changes.
+      setImageUrl(`${baseUrl}/stream?annotated=${annotated}&t=${new Date().getTime()}`);
+      return () => {
+        // Unmounting leaves the element's src alone; clearing it is what closes the stream
+        if (imgRef.current) imgRef.current.src = '';
+        imgRef.current = null;
+        setImageUrl('');
+      };
+    }
+
+    // Poll the snapshot with a stable URL so the browser revalidates it with If-None-Match;
+    // only a new ETag means a new frame worth decoding
+    let cancelled = false;
+    let timeoutId: ReturnType<typeof setTimeout> | undefined;
+    let lastEtag: string | null = null;
+    let objectUrl = '';
+    const poll = async () => {
+      try {
+        const response = await fetch(`${baseUrl}/snapshot?annotated=${annotated}`, { cache: 'no-cache' });
+        if (!response.ok) throw new Error(`Snapshot failed: ${response.status}`);
+        const etag = response.headers.get('ETag');
+        if (!cancelled) setHasError(false);
+        if (!cancelled && (etag === null || etag !== lastEtag)) {
+          lastEtag = etag;
+          const nextUrl = URL.createObjectURL(await response.blob());
+          if (objectUrl) URL.revokeObjectURL(objectUrl);
+          objectUrl = nextUrl;
+          setImageUrl(nextUrl);
+        }
+      } catch {
+        // Keep polling: the camera may just not have produced a frame yet
+        if (!cancelled) setHasError(true);
+      }
+      if (!cancelled) timeoutId = setTimeout(poll, SNAPSHOT_INTERVAL_MS);
+    };
+    poll();
+    return () => {
+      cancelled = true;
+      clearTimeout(timeoutId);
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+      setImageUrl('');
     };
-    updateImage();
-    const intervalId = setInterval(updateImage, 100);
-    return () => clearInterval(intervalId);
-  }, [camera.camera_id, annotated]);
+  }, [camera.camera_id, annotated, live]);
 
   const handleError = () => {
     setHasError(true);
@@ -37,10 +85,12 @@ export function StreamView({ camera, annotated = true }: StreamViewProps) {
   // --- FIX: Only render the image if the URL is set ---
   return imageUrl ? (
     <img
+      ref={(el) => { if (el) imgRef.current = el; }}
       src={imageUrl}
       alt={`Live stream from ${camera.name}`}
       className="w-full h-full object-contain"
-      onError={handleError}
+      // Snapshot errors are handled by the poll; a revoked blob URL may briefly fail to load
+      onError={live ? handleError : undefined}
     />
   ) : (
     // Optional: Show a loading state
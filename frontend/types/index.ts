@@ -10,6 +10,7 @@ export interface CameraConfig {
   name?: string;
   line_points?: [number, number][];
   enabled: boolean;
+  high_accuracy?: boolean;
 }
 
 // Tracking statistics type